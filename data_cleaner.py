@@ -1,130 +1,190 @@
-import os
-import json
-import re
-import logging
-import hashlib
-from bs4 import BeautifulSoup
-import bleach
-from src.utils import normalize_choices, extract_core_content
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger("DataCleaner")
-
-
-def clean_html(raw_html: str) -> str:
-    math_pattern = re.compile(r'(\$(.*?)\$|\\\[(.*?)\\\])')
-    math_blocks = []
-
-    def save_math(match):
-        math_blocks.append(match.group(0))
-        return f'__MATH_{len(math_blocks) - 1}__'
-
-    protected_html = math_pattern.sub(save_math, raw_html)
-
-    allowed_tags = [
-        'p', 'div', 'span', 'br', 'ol', 'ul', 'li',
-        'table', 'tr', 'td', 'th', 'strong', 'em', 'b', 'i'
-    ]
-    cleaned = bleach.clean(protected_html, tags=allowed_tags, strip=True)
-    soup = BeautifulSoup(cleaned, 'html.parser')
-    for tag in soup.find_all(True):
-        tag.attrs = {}
-    clean_text = str(soup)
-    clean_text = re.sub(r'\s+', ' ', clean_text)
-    clean_text = re.sub(r'[\x00-\x1f\x7f-\x9f]', '', clean_text)
-
-    def restore_math(match):
-        idx = int(match.group(1))
-        return math_blocks[idx] if idx < len(math_blocks) else ""
-
-    return re.sub(r'__MATH_(\d+)__', restore_math, clean_text.strip())
-
-
-def segment_text(text: str, max_length=500) -> list:
-    paragraphs = [p.strip() for p in text.split('\n') if p.strip()]
-    segmented = []
-    for para in paragraphs:
-        if len(para) <= max_length:
-            segmented.append(para)
-            continue
-        punctuation_segments = []
-        current_segment = ""
-        for char in para:
-            current_segment += char
-            if char in {'。', '？', '！', '；'} and len(current_segment) >= max_length * 0.3:
-                punctuation_segments.append(current_segment.strip())
-                current_segment = ""
-        if current_segment:
-            punctuation_segments.append(current_segment.strip())
-        for seg in punctuation_segments:
-            if len(seg) <= max_length:
-                segmented.append(seg)
-            else:
-                words = seg.split()
-                current_fragment = []
-                current_length = 0
-                for word in words:
-                    if current_length + len(word) + 1 > max_length and current_fragment:
-                        segmented.append(" ".join(current_fragment))
-                        current_fragment = []
-                        current_length = 0
-                    current_fragment.append(word)
-                    current_length += len(word) + 1
-                if current_fragment:
-                    segmented.append(" ".join(current_fragment))
-    return segmented
-
-
-def get_content_fingerprint(question: dict, paper_id: str) -> str:
-    """生成带试卷标识的内容指纹，避免同内容题目被误去重"""
-    # 使用核心内容生成指纹
-    core_text = extract_core_content(question.get("text", ""))
-
-    # 加入 paper_id，保证不同试卷的相同内容不会被当成重复
-    content_with_id = f"{paper_id}::{core_text.strip()}"
-    return hashlib.sha256(content_with_id.encode('utf-8')).hexdigest()
-
-
-def clean_paper_data(input_file: str, output_file: str, paper_id: str = None, deduplicate: bool = True):
-    logger.info(f"开始清洗试卷数据: {input_file}")
-    with open(input_file, 'r', encoding='utf-8') as f:
-        exam_data = json.load(f)
-
-    cleaned_questions = []
-    seen_fingerprints = set()
-
-    # 若未指定 paper_id，则用文件名
-    if not paper_id:
-        paper_id = os.path.basename(input_file)
-
-    for question in exam_data:
-        rich_content = question.get("richTextContent", "")
-        question_id = question.get("id", "")
-        cleaned_content = clean_html(rich_content)
-        segments = segment_text(cleaned_content)
-        cleaned_question = {
-            "id": question_id,
-            "type": question.get("type", "未知"),
-            "text": cleaned_content,
-            "segments": segments
-        }
-
-        # 总是生成指纹
-        fingerprint = get_content_fingerprint(cleaned_question, paper_id)
-        cleaned_question["fingerprint"] = fingerprint
-
-        # 只有在启用去重且指纹未见过时才添加
-        if deduplicate and fingerprint in seen_fingerprints:
-            logger.info(f"跳过重复题目: {question_id}")
-            continue
-
-        seen_fingerprints.add(fingerprint)
-        cleaned_questions.append(cleaned_question)
-
-    os.makedirs(os.path.dirname(output_file), exist_ok=True)
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(cleaned_questions, f, indent=2, ensure_ascii=False)
+import os
+import re
+import logging
+import hashlib
+import orjson
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+from datasketch import MinHash, MinHashLSH
+from src.utils import normalize_choices, extract_core_content, load_json_file
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("DataCleaner")
+
+# 模块级预编译正则，避免每次调用重新构建
+_MATH_RE = re.compile(r'(\$(.*?)\$|\\\[(.*?)\\\])')
+_CTRL_RE = re.compile(r'[\x00-\x1f\x7f-\x9f]')
+_WS_RE = re.compile(r'\s+')
+_RESTORE_RE = re.compile(r'__MATH_(\d+)__')
+_SENT_END_RE = re.compile(r'[。？！；]')
+
+_ALLOWED_TAGS = frozenset({
+    'p', 'div', 'span', 'br', 'ol', 'ul', 'li',
+    'table', 'tr', 'td', 'th', 'strong', 'em', 'b', 'i'
+})
+# 数学公式已先行替换为占位符，标签过滤用单个正则即可，不需要完整HTML解析器
+_TAG_RE = re.compile(r'<(/?)([a-zA-Z][a-zA-Z0-9]*)[^>]*>')
+_COMMENT_RE = re.compile(r'<!--.*?-->', re.DOTALL)
+
+
+def _filter_tag(match) -> str:
+    """白名单内的标签保留（去掉属性），其余标签整体丢弃、仅保留内部文本"""
+    slash, name = match.group(1), match.group(2).lower()
+    if name in _ALLOWED_TAGS:
+        return f'<{slash}{name}>'
+    return ''
+
+
+@lru_cache(maxsize=50000)
+def clean_html(raw_html: str) -> str:
+    # 题库里同一题干在多份试卷间大量复用，缓存可跳过整个清洗流程
+    math_blocks = []
+
+    def save_math(match):
+        math_blocks.append(match.group(0))
+        return f'__MATH_{len(math_blocks) - 1}__'
+
+    protected_html = _MATH_RE.sub(save_math, raw_html)
+
+    clean_text = _COMMENT_RE.sub('', protected_html)
+    clean_text = _TAG_RE.sub(_filter_tag, clean_text)
+    clean_text = _WS_RE.sub(' ', clean_text)
+    clean_text = _CTRL_RE.sub('', clean_text)
+
+    def restore_math(match):
+        idx = int(match.group(1))
+        return math_blocks[idx] if idx < len(math_blocks) else ""
+
+    return _RESTORE_RE.sub(restore_math, clean_text.strip())
+
+
+def _merge_words(words: list, max_length: int) -> list:
+    """
+    把词列表贪心合并成不超过 max_length 的片段。
+    用词长累计和 + searchsorted 直接算出每个切分点，
+    替代逐词累加长度的Python循环。
+    """
+    offsets = np.cumsum(np.fromiter((len(w) + 1 for w in words), dtype=np.int64, count=len(words)))
+    fragments = []
+    start = 0
+    base = 0
+    while start < len(words):
+        cut = int(np.searchsorted(offsets, base + max_length, side='right'))
+        if cut == start:
+            # 单个词本身超长时单独成段
+            cut = start + 1
+        fragments.append(" ".join(words[start:cut]))
+        start = cut
+        base = int(offsets[cut - 1])
+    return fragments
+
+
+def segment_text(text: str, max_length=500) -> list:
+    paragraphs = [p.strip() for p in text.split('\n') if p.strip()]
+    segmented = []
+    for para in paragraphs:
+        if len(para) <= max_length:
+            segmented.append(para)
+            continue
+        # 一次正则扫描找出所有句末标点位置，替代逐字符拼接
+        punctuation_segments = []
+        min_length = max_length * 0.3
+        last_cut = 0
+        for match in _SENT_END_RE.finditer(para):
+            end = match.end()
+            if end - last_cut >= min_length:
+                punctuation_segments.append(para[last_cut:end].strip())
+                last_cut = end
+        if last_cut < len(para):
+            punctuation_segments.append(para[last_cut:].strip())
+        for seg in punctuation_segments:
+            if len(seg) <= max_length:
+                segmented.append(seg)
+            else:
+                segmented.extend(_merge_words(seg.split(), max_length))
+    return segmented
+
+
+def get_content_fingerprint(question: dict, paper_id: str) -> str:
+    """生成带试卷标识的内容指纹，避免同内容题目被误去重"""
+    # 使用核心内容生成指纹
+    core_text = extract_core_content(question.get("text", ""))
+
+    # 加入 paper_id，保证不同试卷的相同内容不会被当成重复；
+    # 去重只需防碰撞不需要加密强度，128位 blake2b 比 sha256 快得多
+    content_with_id = f"{paper_id}::{core_text.strip()}"
+    return hashlib.blake2b(content_with_id.encode('utf-8'), digest_size=16).hexdigest()
+
+
+# MinHash去重参数：64个置换已足够区分题目级文本，阈值0.9近似"几乎相同"
+_MINHASH_PERMS = 64
+_LSH_THRESHOLD = 0.9
+_SHINGLE_SIZE = 5
+
+
+def _build_minhash(text: str) -> MinHash:
+    """对核心文本的字符shingle构建MinHash签名"""
+    minhash = MinHash(num_perm=_MINHASH_PERMS)
+    if len(text) <= _SHINGLE_SIZE:
+        shingles = {text} if text else set()
+    else:
+        shingles = {text[i:i + _SHINGLE_SIZE] for i in range(len(text) - _SHINGLE_SIZE + 1)}
+    for shingle in shingles:
+        minhash.update(shingle.encode('utf-8'))
+    return minhash
+
+
+def _clean_one(question: dict, paper_id: str) -> dict:
+    """清洗单个题目（供进程池调用，需保持模块级可pickle）"""
+    cleaned_content = clean_html(question.get("richTextContent", ""))
+    cleaned_question = {
+        "id": question.get("id", ""),
+        "type": question.get("type", "未知"),
+        "text": cleaned_content,
+        "segments": segment_text(cleaned_content)
+    }
+    # 总是生成指纹
+    cleaned_question["fingerprint"] = get_content_fingerprint(cleaned_question, paper_id)
+    return cleaned_question
+
+
+def clean_paper_data(input_file: str, output_file: str, paper_id: str = None, deduplicate: bool = True):
+    logger.info(f"开始清洗试卷数据: {input_file}")
+    exam_data = load_json_file(input_file)
+
+    cleaned_questions = []
+
+    # 若未指定 paper_id，则用文件名
+    if not paper_id:
+        paper_id = os.path.basename(input_file)
+
+    # 逐题清洗是CPU密集且相互独立的，大试卷用进程池并行；
+    # 小试卷走串行，避免进程池启动开销反而更慢
+    if len(exam_data) >= 64:
+        with ProcessPoolExecutor(max_workers=os.cpu_count()) as pool:
+            cleaned_iter = pool.map(partial(_clean_one, paper_id=paper_id), exam_data, chunksize=32)
+            cleaned_all = list(cleaned_iter)
+    else:
+        cleaned_all = [_clean_one(question, paper_id) for question in exam_data]
+
+    # 去重在主进程串行完成：MinHash LSH 能识别只差几个字符的近重复题目，
+    # 而精确指纹只能命中完全相同的文本
+    lsh = MinHashLSH(threshold=_LSH_THRESHOLD, num_perm=_MINHASH_PERMS)
+    for cleaned_question in cleaned_all:
+        if deduplicate:
+            minhash = _build_minhash(extract_core_content(cleaned_question["text"]))
+            if lsh.query(minhash):
+                logger.info(f"跳过近重复题目: {cleaned_question['id']}")
+                continue
+            lsh.insert(cleaned_question["fingerprint"], minhash)
+
+        cleaned_questions.append(cleaned_question)
+
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    with open(output_file, 'wb') as f:
+        f.write(orjson.dumps(cleaned_questions, option=orjson.OPT_INDENT_2))
     logger.info(f"清洗完成! 结果保存到: {output_file}, 题目数量: {len(cleaned_questions)}")
\ No newline at end of file
@@ -4,6 +4,7 @@ import json
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 import tempfile
+import threading
 import logging
 import shutil
 from src.data_processing.data_cleaner import clean_paper_data
@@ -43,6 +44,9 @@ class ExamSimilarityApp:
         self.type_sensitive_var = tk.BooleanVar(value=True)
         self.deduplicate_var = tk.BooleanVar(value=True)
 
+        # 后台分析线程（避免流水线阻塞Tk主循环）
+        self._worker = None
+
         # 创建UI组件
         self.create_widgets()
 
@@ -349,10 +353,13 @@ class ExamSimilarityApp:
         self.status_var.set("结果已清除")
 
     def update_progress(self, value, message=None):
+        # 可能在工作线程中被调用，统一调度回Tk主线程执行
+        self.root.after(0, self._apply_progress, value, message)
+
+    def _apply_progress(self, value, message):
         self.progress_var.set(value)
         if message:
             self.status_var.set(message)
-        self.root.update_idletasks()  # 确保UI更新
 
     def start_analysis(self):
         # 验证输入
@@ -368,6 +375,28 @@ class ExamSimilarityApp:
             messagebox.showerror("错误", "文件不存在!")
             return
 
+        if self._worker is not None and self._worker.is_alive():
+            messagebox.showwarning("提示", "分析正在进行中，请等待当前任务完成")
+            return
+
+        # Tk变量只在主线程读取，参数拷贝后交给工作线程
+        params = {
+            "model_type": self.MODEL_MAP[self.model_var.get()],
+            "threshold": self.threshold_var.get(),
+            "type_sensitive": self.type_sensitive_var.get(),
+            "fusion_weight": self.fusion_var.get(),
+            "deduplicate": self.deduplicate_var.get()
+        }
+
+        # 整条流水线放到后台线程，避免冻结界面
+        self._worker = threading.Thread(
+            target=self._run_analysis,
+            args=(paper_a, paper_b, output_path, params),
+            daemon=True
+        )
+        self._worker.start()
+
+    def _run_analysis(self, paper_a, paper_b, output_path, params):
         try:
             # 创建临时目录
             temp_dir = tempfile.mkdtemp(prefix="exam_similarity_")
@@ -378,30 +407,30 @@ class ExamSimilarityApp:
             vector_a = os.path.join(temp_dir, "paper_a_vectorized.json")
 
             self.update_progress(10, "清洗试卷A...")
-            clean_paper_data(paper_a, cleaned_a, paper_id="paper_a", deduplicate=self.deduplicate_var.get())
+            clean_paper_data(paper_a, cleaned_a, paper_id="paper_a", deduplicate=params["deduplicate"])
 
             self.update_progress(30, "向量化试卷A...")
-            vectorize_paper(cleaned_a, vector_a, self.MODEL_MAP[self.model_var.get()], model_dir=self.models_dir)
+            vectorize_paper(cleaned_a, vector_a, params["model_type"], model_dir=self.models_dir)
 
             # 处理试卷B
             cleaned_b = os.path.join(temp_dir, "paper_b_cleaned.json")
             vector_b = os.path.join(temp_dir, "paper_b_vectorized.json")
 
             self.update_progress(40, "清洗试卷B...")
-            clean_paper_data(paper_b, cleaned_b, paper_id="paper_b", deduplicate=self.deduplicate_var.get())
+            clean_paper_data(paper_b, cleaned_b, paper_id="paper_b", deduplicate=params["deduplicate"])
 
             self.update_progress(60, "向量化试卷B...")
-            vectorize_paper(cleaned_b, vector_b, self.MODEL_MAP[self.model_var.get()], model_dir=self.models_dir)
+            vectorize_paper(cleaned_b, vector_b, params["model_type"], model_dir=self.models_dir)
 
             # 计算相似度
             self.update_progress(70, "计算相似度...")
             results = calculate_similarity(
                 vector_a,
                 vector_b,
-                threshold=self.threshold_var.get(),
-                type_sensitive=self.type_sensitive_var.get(),
-                fusion_weight=self.fusion_var.get(),
-                deduplicate=self.deduplicate_var.get()
+                threshold=params["threshold"],
+                type_sensitive=params["type_sensitive"],
+                fusion_weight=params["fusion_weight"],
+                deduplicate=params["deduplicate"]
             )
 
             # 保存结果
@@ -410,21 +439,21 @@ class ExamSimilarityApp:
             with open(output_path, "w", encoding="utf-8") as f:
                 json.dump(results, f, ensure_ascii=False, indent=2)
 
-            # 显示结果
+            # 显示结果（UI操作调度回主线程）
             self.update_progress(95, "生成结果报告...")
-            self.display_results(results)
+            self.root.after(0, self.display_results, results)
             self.update_progress(100, f"分析完成! 结果已保存到: {output_path}")
 
         except Exception as e:
-            messagebox.showerror("错误", f"处理过程中发生错误: {str(e)}")
             logger.exception("分析过程中出错")
+            self.root.after(0, messagebox.showerror, "错误", f"处理过程中发生错误: {str(e)}")
             self.update_progress(0, f"错误: {str(e)}")
         finally:
             # 清理临时文件
             try:
                 if 'temp_dir' in locals() and os.path.exists(temp_dir):
                     shutil.rmtree(temp_dir)
-                    self.status_var.set(f"{self.status_var.get()} | 临时文件已清理")
+                    self.root.after(0, lambda: self.status_var.set(f"{self.status_var.get()} | 临时文件已清理"))
             except Exception as e:
                 logger.warning(f"清理临时文件失败: {str(e)}")
 
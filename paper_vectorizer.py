@@ -1,62 +1,106 @@
-import sys
-import os
-import json
-import time
-import logging
-import numpy as np
-from .vectorizer import TextVectorizer
-
-logger = logging.getLogger("PaperVectorizer")
-
-
-def vectorize_paper(input_file: str, output_file: str, model_type: str = "sentence-bert", model_dir: str = None):
-    logger.info(f"开始向量化试卷: {input_file}")
-    with open(input_file, "r", encoding="utf-8") as f:
-        exam_data = json.load(f)
-
-    vectorizer = TextVectorizer(model_type, model_dir=model_dir)
-    start_time = time.time()
-    vectorized_questions = []
-
-    for question in exam_data:
-        question_text = question["text"]
-        segments = question.get("segments", [])
-        question_data = {
-            "id": question["id"],
-            "type": question["type"],
-            "score": question.get("score", 0),
-            "text": question_text,
-            "segments": segments,
-            "fingerprint": question.get("fingerprint", ""),
-            "vector": None
-        }
-
-        # 添加空向量处理
-        if segments:
-            embeddings = []
-            for seg in segments:
-                emb = vectorizer.vectorize_text(seg)
-                if emb is not None:
-                    embeddings.append(emb)
-            if embeddings:
-                question_data["vector"] = np.mean(embeddings, axis=0).tolist()
-        else:
-            embedding = vectorizer.vectorize_text(question_text)
-            if embedding is not None:
-                question_data["vector"] = embedding.tolist()
-            else:
-                # 添加空向量处理
-                logger.warning(f"题目 {question['id']} 向量化失败，使用零向量替代")
-                question_data["vector"] = np.zeros(vectorizer.vector_size).tolist()
-
-        vectorized_questions.append(question_data)
-
-    elapsed = time.time() - start_time
-    logger.info(f"向量化完成! 耗时: {elapsed:.2f}秒")
-    os.makedirs(os.path.dirname(output_file), exist_ok=True)
-    with open(output_file, "w", encoding="utf-8") as f:
-        json.dump({
-            "model": model_type,
-            "questions": vectorized_questions
-        }, f, indent=2, ensure_ascii=False)
-    logger.info(f"结果已保存到: {output_file}")
\ No newline at end of file
+import sys
+import os
+import orjson
+import time
+import logging
+import hashlib
+import functools
+import numpy as np
+from .vectorizer import TextVectorizer
+from src.utils import extract_core_content, load_json_file
+
+logger = logging.getLogger("PaperVectorizer")
+
+
+@functools.lru_cache(maxsize=4)
+def _get_vectorizer(model_type: str, model_dir: str) -> TextVectorizer:
+    """按 (model_type, model_dir) 复用向量化器，避免每次调用重新加载模型权重"""
+    return TextVectorizer(model_type, model_dir=model_dir)
+
+
+def vectorize_paper(input_file: str, output_file: str, model_type: str = "sentence-bert", model_dir: str = None):
+    logger.info(f"开始向量化试卷: {input_file}")
+    exam_data = load_json_file(input_file)
+
+    vectorizer = _get_vectorizer(model_type, model_dir)
+    start_time = time.time()
+    vectorized_questions = []
+
+    # 嵌入磁盘缓存：同一模型对同一核心文本的向量在多次运行间直接复用
+    cache_dir = os.path.join(model_dir, "cache", model_type) if model_dir else None
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+
+    # 汇总所有分段后单次批量编码，替代逐段前向传播；缓存命中的题目不进编码批次
+    all_segments = []
+    ownership = []      # 每题在 all_segments 中的 (起始位置, 分段数)
+    cache_keys = []     # 每题的缓存键（无缓存目录/空题为None）
+    cached_vectors = {}
+    for idx, question in enumerate(exam_data):
+        segments = question.get("segments", []) or [question["text"]]
+        core_segments = [s for s in (extract_core_content(seg) for seg in segments) if s.strip()]
+
+        key = None
+        if cache_dir and core_segments:
+            content = f"{model_type}:" + "\n".join(core_segments)
+            key = hashlib.blake2b(content.encode('utf-8'), digest_size=16).hexdigest()
+            cache_path = os.path.join(cache_dir, key + ".npy")
+            if os.path.exists(cache_path):
+                cached_vectors[idx] = np.load(cache_path)
+                cache_keys.append(None)
+                ownership.append((len(all_segments), 0))
+                continue
+
+        cache_keys.append(key)
+        ownership.append((len(all_segments), len(core_segments)))
+        all_segments.extend(core_segments)
+
+    if cached_vectors:
+        logger.info(f"向量缓存命中 {len(cached_vectors)}/{len(exam_data)} 题")
+    embeddings = vectorizer.encode_batch(all_segments)
+
+    # 预分配整卷向量矩阵并逐行写入，省掉Python列表、tolist和stack的二次拷贝
+    vector_matrix = np.empty((len(exam_data), vectorizer.vector_size), dtype=np.float32)
+
+    for row, (question, (start, count)) in enumerate(zip(exam_data, ownership)):
+        question_data = {
+            "id": question["id"],
+            "type": question["type"],
+            "score": question.get("score", 0),
+            "text": question["text"],
+            "segments": question.get("segments", []),
+            "fingerprint": question.get("fingerprint", "")
+        }
+
+        # 按归属切片做均值池化；缓存命中直接回填，空文本题目回退为零向量
+        if row in cached_vectors:
+            vector_matrix[row] = cached_vectors[row]
+        elif count:
+            pooled = embeddings[start:start + count].mean(axis=0)
+            vector_matrix[row] = pooled
+            if cache_keys[row]:
+                np.save(os.path.join(cache_dir, cache_keys[row] + ".npy"),
+                        np.asarray(pooled, dtype=np.float32))
+        else:
+            logger.warning(f"题目 {question['id']} 向量化失败，使用零向量替代")
+            vector_matrix[row] = 0.0
+
+        vectorized_questions.append(question_data)
+
+    elapsed = time.time() - start_time
+    logger.info(f"向量化完成! 耗时: {elapsed:.2f}秒")
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+
+    # 行向量归一化后以float16存储：余弦相似度退化为点积，磁盘与带宽减半
+    norms = np.linalg.norm(vector_matrix, axis=1, keepdims=True)
+    vector_matrix /= np.maximum(norms, 1e-12)
+    vector_file = output_file + ".npy"
+    np.save(vector_file, vector_matrix.astype(np.float16))
+
+    with open(output_file, "wb") as f:
+        f.write(orjson.dumps({
+            "model": model_type,
+            "vector_file": os.path.basename(vector_file),
+            "questions": vectorized_questions
+        }, option=orjson.OPT_INDENT_2))
+    logger.info(f"结果已保存到: {output_file} (向量: {vector_file})")
\ No newline at end of file
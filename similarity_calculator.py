@@ -1,128 +1,172 @@
-import os
-import json
-import numpy as np
-import logging
-from sklearn.metrics.pairwise import cosine_similarity
-import sys
-
-# 添加路径以确保正确导入
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from .vectorizer import euclidean_distance  # 使用vectorizer中的实现
-
-logger = logging.getLogger("SimilarityCalculator")
-
-def fused_similarity(v_a: np.ndarray,
-                     v_b: np.ndarray,
-                     w_cos: float = 0.6) -> float:
-    """
-    余弦 + 欧氏 融合距离 → 相似度
-    w_cos 越大，余弦占比越高
-    """
-    v_a = v_a.reshape(1, -1)
-    v_b = v_b.reshape(1, -1)
-
-    cos_sim = cosine_similarity(v_a, v_b)[0, 0]
-    euc_dist = euclidean_distance(v_a.flatten(), v_b.flatten())
-    euc_sim = 1 / (1 + euc_dist)  # 转成 0~1
-
-    return w_cos * cos_sim + (1 - w_cos) * euc_sim
-
-def calculate_similarity(
-        paper_a_file: str,
-        paper_b_file: str,
-        threshold: float = 0.7,
-        type_sensitive: bool = True,
-        fusion_weight: float = 0.6,
-        deduplicate: bool = True
-) -> dict:
-    logger.info(f"计算试卷相似度: {paper_a_file} vs {paper_b_file}")
-
-    with open(paper_a_file, "r", encoding="utf-8") as f:
-        paper_a = json.load(f)
-    with open(paper_b_file, "r", encoding="utf-8") as f:
-        paper_b = json.load(f)
-
-    # 收集向量 & 题号 & 文本
-    vectors_a, info_a = [], []
-    for q in paper_a["questions"]:
-        if "vector" in q and q["vector"] is not None:
-            vectors_a.append(np.array(q["vector"]))
-            info_a.append({
-                "id": q["id"],
-                "type": q["type"],
-                "text": q["text"]
-            })
-
-    vectors_b, info_b = [], []
-    for q in paper_b["questions"]:
-        if "vector" in q and q["vector"] is not None:
-            vectors_b.append(np.array(q["vector"]))
-            info_b.append({
-                "id": q["id"],
-                "type": q["type"],
-                "text": q["text"]
-            })
-
-    if not vectors_a or not vectors_b:
-        return {
-            "paper_a": paper_a_file,
-            "paper_b": paper_b_file,
-            "method": "fused",
-            "threshold": threshold,
-            "type_sensitive": type_sensitive,
-            "fusion_weight": fusion_weight,
-            "total_questions_a": len(vectors_a),
-            "total_questions_b": len(vectors_b),
-            "total_pairs": 0,
-            "similar_pairs": []
-        }
-
-    # 使用矩阵运算优化计算效率
-    matrix_a = np.array(vectors_a)
-    matrix_b = np.array(vectors_b)
-
-    # 计算余弦相似度矩阵
-    cos_sim_matrix = cosine_similarity(matrix_a, matrix_b)
-
-    # 优化欧氏距离计算 - 向量化替代循环
-    # 计算差值矩阵
-    diff = matrix_a[:, np.newaxis, :] - matrix_b[np.newaxis, :, :]
-    # 计算平方和
-    squared_diff = np.sum(diff**2, axis=-1)
-    # 计算欧氏距离
-    euc_dist_matrix = np.sqrt(squared_diff)
-    # 转换为相似度
-    euc_sim_matrix = 1 / (1 + euc_dist_matrix)
-
-    # 融合相似度
-    fused_sim_matrix = fusion_weight * cos_sim_matrix + (1 - fusion_weight) * euc_sim_matrix
-
-    # 找出满足条件的相似对
-    similar_pairs = []
-    for i in range(len(info_a)):
-        for j in range(len(info_b)):
-            if type_sensitive and info_a[i]["type"] != info_b[j]["type"]:
-                continue
-            sim = fused_sim_matrix[i][j]
-            if sim >= threshold:
-                similar_pairs.append({
-                    "paper_a": info_a[i],
-                    "paper_b": info_b[j],
-                    "similarity": float(sim)
-                })
-
-    similar_pairs.sort(key=lambda x: x["similarity"], reverse=True)
-
-    return {
-        "paper_a": paper_a_file,
-        "paper_b": paper_b_file,
-        "method": "fused",
-        "threshold": threshold,
-        "type_sensitive": type_sensitive,
-        "fusion_weight": fusion_weight,
-        "total_questions_a": len(vectors_a),
-        "total_questions_b": len(vectors_b),
-        "total_pairs": len(similar_pairs),
-        "deduplicate": deduplicate,
-        "similar_pairs": similar_pairs
+import os
+import numpy as np
+import logging
+import sys
+
+# 添加路径以确保正确导入
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from .vectorizer import euclidean_distance  # 使用vectorizer中的实现
+from src.utils import load_json_file
+
+logger = logging.getLogger("SimilarityCalculator")
+
+# faiss是可选加速项：装了就用它的SIMD/GPU内积扫描，没装回退NumPy矩阵乘
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+# 超过该对数规模才值得走faiss（小矩阵BLAS已经足够快）
+_FAISS_MIN_PAIRS = 250_000
+
+# faiss GPU索引的k选择上限：全量检索k=M超过它时只能留在CPU
+_FAISS_GPU_MAX_K = 2048
+
+
+def _cosine_matrix(matrix_a: np.ndarray, matrix_b: np.ndarray) -> np.ndarray:
+    """
+    计算归一化向量间的余弦相似度矩阵。
+    大规模比对时用 faiss IndexFlatIP（可用GPU时自动迁移），否则直接矩阵乘。
+    """
+    if faiss is None or matrix_a.shape[0] * matrix_b.shape[0] < _FAISS_MIN_PAIRS:
+        return matrix_a @ matrix_b.T
+
+    matrix_a = np.ascontiguousarray(matrix_a, dtype=np.float32)
+    matrix_b = np.ascontiguousarray(matrix_b, dtype=np.float32)
+    index = faiss.IndexFlatIP(matrix_b.shape[1])
+    # GPU索引的选择算子最多只支持k=2048，全量检索k=M超限时留在CPU执行
+    if (matrix_b.shape[0] <= _FAISS_GPU_MAX_K
+            and hasattr(faiss, 'StandardGpuResources') and faiss.get_num_gpus() > 0):
+        index = faiss.index_cpu_to_gpu(faiss.StandardGpuResources(), 0, index)
+    index.add(matrix_b)
+
+    # k=M 的全量检索返回按相似度排序的 (D, I)，按列索引还原成完整矩阵
+    sims, indices = index.search(matrix_a, matrix_b.shape[0])
+    cos_matrix = np.empty((matrix_a.shape[0], matrix_b.shape[0]), dtype=np.float32)
+    cos_matrix[np.arange(matrix_a.shape[0])[:, np.newaxis], indices] = sims
+    return cos_matrix
+
+def fused_similarity(v_a: np.ndarray,
+                     v_b: np.ndarray,
+                     w_cos: float = 0.6) -> float:
+    """
+    余弦 + 欧氏 融合距离 → 相似度
+    w_cos 越大，余弦占比越高
+    """
+    v_a = v_a.flatten()
+    v_b = v_b.flatten()
+
+    # 直接归一化点积，省掉sklearn的输入校验和矩阵拷贝
+    norm_prod = max(np.linalg.norm(v_a) * np.linalg.norm(v_b), 1e-12)
+    cos_sim = float(np.dot(v_a, v_b) / norm_prod)
+    euc_dist = euclidean_distance(v_a, v_b)
+    euc_sim = 1 / (1 + euc_dist)  # 转成 0~1
+
+    return w_cos * cos_sim + (1 - w_cos) * euc_sim
+
+def _load_paper_vectors(paper_file: str, paper: dict):
+    """
+    加载试卷向量矩阵与题目信息（SoA平行数组：ids / types / texts）。
+    优先用 .npy 向量文件零拷贝(mmap)读取，旧格式回退JSON内嵌向量。
+    """
+    questions = paper["questions"]
+    npy_file = paper_file + ".npy"
+    if os.path.exists(npy_file):
+        matrix = np.load(npy_file, mmap_mode='r')
+        with_vec = questions
+    else:
+        # 旧格式：先数一遍行数，一次性分配连续矩阵再逐行填充，
+        # 避免每题一个小数组外加一次stack拷贝
+        with_vec = [q for q in questions if q.get("vector") is not None]
+        if not with_vec:
+            return np.zeros((0, 0)), [], [], []
+        matrix = np.empty((len(with_vec), len(with_vec[0]["vector"])), dtype=np.float32)
+        for i, q in enumerate(with_vec):
+            matrix[i] = q["vector"]
+
+    ids = [q["id"] for q in with_vec]
+    types = [q["type"] for q in with_vec]
+    texts = [q["text"] for q in with_vec]
+    return matrix, ids, types, texts
+
+def calculate_similarity(
+        paper_a_file: str,
+        paper_b_file: str,
+        threshold: float = 0.7,
+        type_sensitive: bool = True,
+        fusion_weight: float = 0.6,
+        deduplicate: bool = True
+) -> dict:
+    logger.info(f"计算试卷相似度: {paper_a_file} vs {paper_b_file}")
+
+    paper_a = load_json_file(paper_a_file)
+    paper_b = load_json_file(paper_b_file)
+
+    # 收集向量 & 题号 & 文本（平行数组，类型比较保持在NumPy内完成）
+    matrix_a, ids_a, types_a, texts_a = _load_paper_vectors(paper_a_file, paper_a)
+    matrix_b, ids_b, types_b, texts_b = _load_paper_vectors(paper_b_file, paper_b)
+
+    if not ids_a or not ids_b:
+        return {
+            "paper_a": paper_a_file,
+            "paper_b": paper_b_file,
+            "method": "fused",
+            "threshold": threshold,
+            "type_sensitive": type_sensitive,
+            "fusion_weight": fusion_weight,
+            "total_questions_a": len(ids_a),
+            "total_questions_b": len(ids_b),
+            "total_pairs": 0,
+            "similar_pairs": []
+        }
+
+    # FP16存储、FP32计算：行向量归一化后余弦相似度就是一次矩阵乘
+    matrix_a = np.asarray(matrix_a, dtype=np.float32)
+    matrix_b = np.asarray(matrix_b, dtype=np.float32)
+    matrix_a /= np.maximum(np.linalg.norm(matrix_a, axis=1, keepdims=True), 1e-12)
+    matrix_b /= np.maximum(np.linalg.norm(matrix_b, axis=1, keepdims=True), 1e-12)
+    cos_sim_matrix = _cosine_matrix(matrix_a, matrix_b)
+
+    # 欧氏距离用恒等式 ‖a-b‖² = ‖a‖² + ‖b‖² - 2a·b 计算，
+    # 行向量已归一化，直接复用上面的点积矩阵，避免 N·M·D 的广播临时数组
+    euc_dist_matrix = np.sqrt(np.maximum(2.0 - 2.0 * cos_sim_matrix, 0.0))
+    # 转换为相似度
+    euc_sim_matrix = 1 / (1 + euc_dist_matrix)
+
+    # 融合相似度
+    fused_sim_matrix = fusion_weight * cos_sim_matrix + (1 - fusion_weight) * euc_sim_matrix
+
+    # 向量化筛选相似对：阈值掩码 + 整型编码的类型掩码，替代 N*M 的Python双循环
+    keep = fused_sim_matrix >= threshold
+    if type_sensitive:
+        type_map = {}
+        type_ids_a = np.array([type_map.setdefault(t, len(type_map)) for t in types_a], dtype=np.int32)
+        type_ids_b = np.array([type_map.setdefault(t, len(type_map)) for t in types_b], dtype=np.int32)
+        keep &= type_ids_a[:, np.newaxis] == type_ids_b[np.newaxis, :]
+
+    idx_a, idx_b = np.nonzero(keep)
+    sims = fused_sim_matrix[idx_a, idx_b]
+
+    # 只为命中的少数对构建结果字典，按相似度降序
+    similar_pairs = []
+    for k in np.argsort(-sims):
+        i, j = idx_a[k], idx_b[k]
+        similar_pairs.append({
+            "paper_a": {"id": ids_a[i], "type": types_a[i], "text": texts_a[i]},
+            "paper_b": {"id": ids_b[j], "type": types_b[j], "text": texts_b[j]},
+            "similarity": float(sims[k])
+        })
+
+    return {
+        "paper_a": paper_a_file,
+        "paper_b": paper_b_file,
+        "method": "fused",
+        "threshold": threshold,
+        "type_sensitive": type_sensitive,
+        "fusion_weight": fusion_weight,
+        "total_questions_a": len(ids_a),
+        "total_questions_b": len(ids_b),
+        "total_pairs": len(similar_pairs),
+        "deduplicate": deduplicate,
+        "similar_pairs": similar_pairs
     }
\ No newline at end of file
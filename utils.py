@@ -2,16 +2,49 @@ import os
 import json
 import logging
 import numpy as np
+import orjson
 import re
-from bs4 import BeautifulSoup
+import unicodedata
 from typing import Dict, Any, List, Optional
 
+# lxml在extract_core_content内延迟导入：只用到JSON读写等工具时不必加载C解析器
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger("Utils")
 
+# 模块级预编译正则：避免每次调用经过re模块缓存的查找
+_RE_TAG = re.compile(r'<[^>]+>')
+# 题号前缀与分值标注合并为单个alternation：一趟扫描替代两次re.sub
+_RE_QNUM_SCORE = re.compile(
+    r'^(?:\d+[\.、]?|[一二三四五六七八九十]+[、.]?\s*|\(\d+\)|\[\d+\]\s*)\s*'
+    r'|[\(\[][\d\.]+分[\)\]]'
+)
+# 输入已经过NFKC归一化（全角括号/数字折叠为ASCII），字符类无需再列全角变体
+_RE_CHOICE = re.compile(r'^\(?([A-Za-z])\)?\s*(.*)$')
+
+# 已确认存在的输出目录，避免每份报告都走一遍makedirs的stat链
+_ENSURED_DIRS = set()
+
+
+def load_json_file(file_path: str):
+    """
+    读取并解析JSON文件（单次二进制整读 + orjson解析）
+
+    流水线各阶段统一走这里加载输入，后续如需换成io_uring/O_DIRECT
+    之类的读取方式只需要改这一处。
+
+    参数:
+        file_path: JSON文件路径
+
+    返回:
+        解析后的Python对象
+    """
+    with open(file_path, 'rb') as f:
+        return orjson.loads(f.read())
+
 
 def extract_core_content(text: str) -> str:
     """
@@ -27,22 +60,28 @@ def extract_core_content(text: str) -> str:
         return ""
 
     try:
-        # 使用BeautifulSoup移除HTML标签
-        soup = BeautifulSoup(text, 'html.parser')
-        clean_text = soup.get_text(separator=' ', strip=True)
+        # 纯文本快速路径：没有标签和实体时完全跳过HTML解析
+        if '<' not in text and '&' not in text:
+            clean_text = text.strip()
+        else:
+            # 用lxml的C解析器抽取纯文本（比stdlib html.parser快一个数量级）
+            try:
+                from lxml import html as lxml_html
+                clean_text = lxml_html.fromstring(text).text_content().strip()
+            except Exception:
+                # 非HTML或残缺片段：退化为正则去标签
+                clean_text = _RE_TAG.sub(' ', text).strip()
 
-        # 移除题号模式 (例如: "1.", "一、", "(1)", "[1]")
-        clean_text = re.sub(
-            r'^(?:\d+[\.、]?|[一二三四五六七八九十]+[、.]?\s*|\(\d+\)|\[\d+\]\s*)\s*',
-            '',
-            clean_text
-        )
+        # NFKC归一化把全角数字/括号等变体折叠成ASCII等价形式，
+        # 下游正则只需匹配ASCII，也能命中 "１．"、"（5分）" 这类变体
+        clean_text = unicodedata.normalize('NFKC', clean_text)
 
-        # 移除分值信息 (例如: "(5分)", "[10分]")
-        clean_text = re.sub(r'[\(\[][\d\.]+分[\)\]]', '', clean_text)
+        # 单次扫描同时移除题号前缀 (例如: "1.", "一、", "(1)", "[1]")
+        # 和分值信息 (例如: "(5分)", "[10分]")
+        clean_text = _RE_QNUM_SCORE.sub('', clean_text)
 
-        # 移除额外的空白字符
-        clean_text = re.sub(r'\s+', ' ', clean_text).strip()
+        # 移除额外的空白字符：split/join的C实现比等价的\s+正则快数倍
+        clean_text = " ".join(clean_text.split())
 
         return clean_text
     except Exception as e:
@@ -76,8 +115,15 @@ def generate_html_report(results: Dict[str, Any], output_file: str):
             similarities = [pair["similarity"] for pair in similar_pairs]
             overall_similarity = sum(similarities) / len(similarities)
 
-        # 创建HTML内容
-        html_content = f"""
+        # 输出目录只在首次遇到时创建；dirname为空（裸文件名）时落到当前目录
+        out_dir = os.path.dirname(output_file) or '.'
+        if out_dir not in _ENSURED_DIRS:
+            os.makedirs(out_dir, exist_ok=True)
+            _ENSURED_DIRS.add(out_dir)
+
+        # 流式写出：头部、逐行、尾部分别write，避免整份报告在内存里反复拼接
+        with open(output_file, 'w', encoding='utf-8', buffering=1 << 20) as f:
+            f.write(f"""
         <!DOCTYPE html>
         <html lang="zh-CN">
         <head>
@@ -127,24 +173,26 @@ def generate_html_report(results: Dict[str, Any], output_file: str):
                         <th>试卷B题目内容摘要</th>
                         <th>相似度</th>
                     </tr>
-        """
-
-        # 添加相似题目对
-        for idx, pair in enumerate(similar_pairs, 1):
-            q_a = pair.get("paper_a", {})
-            q_b = pair.get("paper_b", {})
-            similarity = pair.get("similarity", 0.0)
-
-            # 高亮显示高度相似的题目
-            row_class = "class='highlight'" if similarity > 0.9 else ""
-
-            # 截取内容摘要
-            text_a = extract_core_content(q_a.get('text', ''))[:100] + '...' if len(
-                q_a.get('text', '')) > 100 else extract_core_content(q_a.get('text', ''))
-            text_b = extract_core_content(q_b.get('text', ''))[:100] + '...' if len(
-                q_b.get('text', '')) > 100 else extract_core_content(q_b.get('text', ''))
-
-            html_content += f"""
+        """)
+
+            # 添加相似题目对：行字符串收集到列表后一次join写出，
+            # 避免O(N²)拼接，也减少write调用次数
+            parts = []
+            for idx, pair in enumerate(similar_pairs, 1):
+                q_a = pair.get("paper_a", {})
+                q_b = pair.get("paper_b", {})
+                similarity = pair.get("similarity", 0.0)
+
+                # 高亮显示高度相似的题目
+                row_class = "class='highlight'" if similarity > 0.9 else ""
+
+                # 截取内容摘要（核心内容只提取一次，长度也按核心内容判断）
+                core_a = extract_core_content(q_a.get('text', ''))
+                core_b = extract_core_content(q_b.get('text', ''))
+                text_a = core_a[:100] + '...' if len(core_a) > 100 else core_a
+                text_b = core_b[:100] + '...' if len(core_b) > 100 else core_b
+
+                parts.append(f"""
                     <tr {row_class}>
                         <td>{idx}</td>
                         <td>{q_a.get('id', '')}</td>
@@ -155,19 +203,15 @@ def generate_html_report(results: Dict[str, Any], output_file: str):
                         <td>{text_b}</td>
                         <td>{similarity:.4f}</td>
                     </tr>
-            """
+            """)
 
-        html_content += """
+            f.write("".join(parts))
+            f.write("""
                 </table>
             </div>
         </body>
         </html>
-        """
-
-        # 写入文件
-        os.makedirs(os.path.dirname(output_file), exist_ok=True)
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write(html_content)
+        """)
 
         logging.info(f"HTML报告已生成: {output_file}")
         return True
@@ -186,25 +230,13 @@ def normalize_choices(choices: List[str]) -> List[str]:
     返回:
         标准化后的选项列表
     """
-    normalized = []
-    for choice in choices:
-        # 清理选项文本
-        cleaned = choice.strip()
-        if not cleaned:
-            normalized.append(choice)
-            continue
-
-        # 尝试匹配标准选项格式
-        match = re.match(r'^([(（]?)([A-Za-z])([)）]?)(.*)$', cleaned)
-        if match:
-            prefix, letter, suffix, content = match.groups()
-            # 标准化为 "(A) 内容" 格式
-            normalized_choice = f"({letter.upper()}) {content.strip()}"
-            normalized.append(normalized_choice)
-        else:
-            # 其他情况保持原样
-            normalized.append(choice)
-    return normalized
+    # 单遍列表推导：NFKC先折叠全角括号/字母，能匹配的标准化为 "(A) 内容"，
+    # 其余（含空串）保持原样
+    return [
+        f"({match.group(1).upper()}) {match.group(2).strip()}"
+        if (match := _RE_CHOICE.match(unicodedata.normalize('NFKC', choice).strip())) else choice
+        for choice in choices
+    ]
 
 
 def calculate_overall_similarity(similar_pairs: List[Dict], total_questions: int) -> float:
@@ -1,25 +1,61 @@
 import os
-import torch
+import re
+import hashlib
 import numpy as np
 import logging
-from transformers import AutoTokenizer, AutoModel
-from sentence_transformers import SentenceTransformer
 from src.utils import extract_core_content
 import sys
 
+# torch / transformers / sentence_transformers 在类内部延迟导入：
+# 只用到距离函数或分段工具时，模块加载不必付数秒的冷启动成本
+
 # 添加路径以确保正确导入
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 logger = logging.getLogger("Vectorizer")
 
+# 进程内嵌入缓存的容量上限（条目数）
+_MEM_CACHE_MAX = 50000
+
+# 按句末标点切句（lookbehind保留标点在句尾）
+_SENT_SPLIT_RE = re.compile(r'(?<=[。？！；])')
+
 def euclidean_distance(v1, v2):
-    """计算欧氏距离（使用numpy实现）"""
-    return np.sqrt(np.sum((v1 - v2) ** 2))
+    """计算欧氏距离（单次融合调用，不产生平方/求和中间数组）"""
+    return np.linalg.norm(v1 - v2)
+
+
+def euclidean_distances(A: np.ndarray, B: np.ndarray) -> np.ndarray:
+    """
+    批量欧氏距离矩阵：‖a-b‖² = ‖a‖² + ‖b‖² - 2a·b，
+    核心是一次BLAS矩阵乘，避免逐对Python调用
+    :return: (len(A), len(B)) 的距离矩阵
+    """
+    sq_a = (A * A).sum(axis=1)[:, np.newaxis]
+    sq_b = (B * B).sum(axis=1)[np.newaxis, :]
+    return np.sqrt(np.maximum(sq_a + sq_b - 2 * (A @ B.T), 0))
+
+
+def cosine_similarities(A: np.ndarray, B: np.ndarray) -> np.ndarray:
+    """
+    批量余弦相似度矩阵：行归一化后做一次矩阵乘
+    :return: (len(A), len(B)) 的相似度矩阵
+    """
+    A_n = A / np.maximum(np.linalg.norm(A, axis=1, keepdims=True), 1e-12)
+    B_n = B / np.maximum(np.linalg.norm(B, axis=1, keepdims=True), 1e-12)
+    return A_n @ B_n.T
 
 class TextVectorizer:
-    def __init__(self, model_type: str, device=None, model_dir=None):
-        """初始化文本向量化工具"""
+    def __init__(self, model_type: str, device=None, model_dir=None, compile_model=False):
+        """初始化文本向量化工具
+
+        compile_model: 是否用 torch.compile 编译模型。编译有明显的
+        预热开销，只在单次会话要处理大量题目时才划算，默认关闭。
+        """
+        import torch
+
         self.model_type = model_type
+        self.compile_model = compile_model
         self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
         logger.info(f"使用设备: {self.device}")
 
@@ -45,6 +81,11 @@ class TextVectorizer:
             logger.error(f"模型目录不存在: {self.model_path}")
             raise FileNotFoundError(f"模型目录不存在: {self.model_path}")
 
+        # 两级嵌入缓存：进程内dict + 磁盘.npy，键为模型+文本哈希
+        self._mem_cache = {}
+        self.cache_dir = os.path.join(self.model_dir, "cache", model_type)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
         # 加载模型
         self.load_model()
 
@@ -53,17 +94,30 @@ class TextVectorizer:
         try:
             logger.info(f"加载模型: {self.model_path}")
             if self.model_type == "sentence-bert":
+                from sentence_transformers import SentenceTransformer
+
                 self.model = SentenceTransformer(self.model_path, device=self.device)
                 self.vector_size = self.model.get_sentence_embedding_dimension()
             else:
-                self.tokenizer = AutoTokenizer.from_pretrained(self.model_path)
+                import torch
+                from transformers import AutoTokenizer, AutoModel
+
+                # Rust快速分词器整批处理时释放GIL并多核并行，慢速Python实现可差1-2个数量级
+                self.tokenizer = AutoTokenizer.from_pretrained(self.model_path, use_fast=True)
+                if not getattr(self.tokenizer, "is_fast", False):
+                    logger.warning(f"模型 {self.model_path} 未提供快速分词器，批量tokenize会明显变慢")
                 self.model = AutoModel.from_pretrained(self.model_path).to(self.device)
                 self.model.eval()
 
+                # GPU上用半精度权重，激活带宽减半
+                if self.device == "cuda":
+                    self.model = self.model.half()
+                if self.compile_model and hasattr(torch, "compile"):
+                    self.model = torch.compile(self.model, mode="reduce-overhead")
+
                 # 获取模型向量大小
                 sample_input = self.tokenizer("测试文本", return_tensors="pt").to(self.device)
-                with torch.no_grad():
-                    output = self.model(**sample_input)
+                output = self._forward(sample_input)
                 self.vector_size = output.last_hidden_state.size(-1)
 
             logger.info(f"模型加载成功! 向量维度: {self.vector_size}")
@@ -72,11 +126,22 @@ class TextVectorizer:
             logger.error(f"加载模型失败: {str(e)}")
             raise RuntimeError(f"模型加载失败: {str(e)}")
 
+    def _forward(self, inputs):
+        """推理前向：inference_mode 比 no_grad 更省（不维护版本计数器），
+        GPU上叠加fp16 autocast"""
+        import torch
+
+        with torch.inference_mode():
+            if self.device == "cuda":
+                with torch.autocast("cuda", dtype=torch.float16):
+                    return self.model(**inputs)
+            return self.model(**inputs)
+
     def vectorize_text(self, text: str) -> np.ndarray:
         """
         对文本进行向量化（支持长文本分段和核心内容提取）
         :param text: 输入文本
-        :return: 文本向量
+        :return: L2归一化后的float16文本向量（余弦相似度可直接用点积计算）
         """
         try:
             # 处理空文本
@@ -89,68 +154,176 @@ class TextVectorizer:
 
             # 长文本分段处理
             segments = self.segment_text(core_text)
-            segment_embeddings = []
-
-            # 向量化每个分段
-            for seg in segments:
-                if self.model_type == "sentence-bert":
-                    emb = self.model.encode([seg])[0]
-                    segment_embeddings.append(emb)
-                else:
-                    # 处理BERT/BGE类模型
-                    inputs = self.tokenizer(
-                        seg,
-                        padding=True,
-                        truncation=True,
-                        max_length=512,
-                        return_tensors="pt"
-                    ).to(self.device)
-
-                    # 推理
-                    with torch.no_grad():
-                        outputs = self.model(**inputs)
-
-                    # 获取最后的隐藏状态
-                    last_hidden_state = outputs.last_hidden_state
-
-                    # 应用改进的加权平均池化
-                    attention_mask = inputs['attention_mask']
-                    input_mask_expanded = attention_mask.unsqueeze(-1).expand(last_hidden_state.size()).float()
-                    sum_embeddings = torch.sum(last_hidden_state * input_mask_expanded, dim=1)
-                    sum_mask = input_mask_expanded.sum(dim=1)
-                    sum_mask = torch.clamp(sum_mask, min=1e-9)
-                    emb = (sum_embeddings / sum_mask).squeeze(0).cpu().numpy()
-
-                    segment_embeddings.append(emb)
-
-            # 合并分段向量
-            if not segment_embeddings:
+            if not segments:
                 return None
 
-            # 简单平均融合
-            return np.mean(segment_embeddings, axis=0)
+            # 所有分段合成一个批次做单次前向传播，摊薄tokenize与推理开销
+            if self.model_type == "sentence-bert":
+                segment_embeddings = self.model.encode(
+                    segments,
+                    batch_size=len(segments),
+                    convert_to_numpy=True,
+                    show_progress_bar=False
+                )
+                # encode已返回连续的(段数, H)矩阵，直接在其上做轴向均值，无额外拷贝
+                emb = segment_embeddings.mean(axis=0)
+            else:
+                # 处理BERT/BGE类模型：整批tokenize后一次推理
+                inputs = self.tokenizer(
+                    segments,
+                    padding=True,
+                    truncation=True,
+                    max_length=512,
+                    return_tensors="pt"
+                ).to(self.device)
+
+                outputs = self._forward(inputs)
+
+                # 掩码加权池化一个表达式完成（fp32保精度），
+                # 跨分段平均也留在设备端，最后只拷贝一个H维向量回CPU
+                attention_mask = inputs['attention_mask']
+                pooled = (outputs.last_hidden_state.float() * attention_mask.unsqueeze(-1)).sum(1) \
+                    / attention_mask.sum(1, keepdim=True).clamp(min=1e-9)
+                emb = pooled.mean(dim=0).cpu().numpy()
+
+            # 归一化后以fp16返回：存储与带宽减半，
+            # 对256维以上的嵌入精度损失可忽略
+            emb = emb / (np.linalg.norm(emb) + 1e-9)
+            return emb.astype(np.float16)
 
         except Exception as e:
             logger.error(f"向量化失败: {text[:20]}... - {str(e)}")
             return None
 
+    def _cache_key(self, text: str) -> str:
+        """嵌入缓存键：模型类型 + 文本内容的128位blake2b"""
+        return hashlib.blake2b(f"{self.model_type}:{text}".encode('utf-8'), digest_size=16).hexdigest()
+
+    def _cache_lookup(self, key: str):
+        """两级查找：先进程内dict，再磁盘.npy（命中则回填内存）"""
+        emb = self._mem_cache.get(key)
+        if emb is not None:
+            return emb
+        cache_path = os.path.join(self.cache_dir, key + ".npy")
+        if os.path.exists(cache_path):
+            emb = np.load(cache_path)
+            self._mem_cache[key] = emb
+            return emb
+        return None
+
+    def _cache_store(self, key: str, emb: np.ndarray):
+        if len(self._mem_cache) >= _MEM_CACHE_MAX:
+            # 淘汰最早插入的条目，保持内存缓存有界
+            self._mem_cache.pop(next(iter(self._mem_cache)))
+        self._mem_cache[key] = emb
+        np.save(os.path.join(self.cache_dir, key + ".npy"), emb)
+
+    def encode_batch(self, texts: list, batch_size: int = 64) -> np.ndarray:
+        """
+        批量向量化文本列表（单次前向传播摊薄推理开销）
+        命中缓存的文本直接回填，只有未命中的部分进模型。
+        :param texts: 输入文本列表
+        :param batch_size: 每批文本数量
+        :return: (len(texts), vector_size) 的向量矩阵
+        """
+        if not texts:
+            return np.zeros((0, self.vector_size))
+
+        keys = [self._cache_key(text) for text in texts]
+        embeddings = np.empty((len(texts), self.vector_size), dtype=np.float32)
+        uncached = []
+        for i, key in enumerate(keys):
+            cached = self._cache_lookup(key)
+            if cached is not None:
+                embeddings[i] = cached
+            else:
+                uncached.append(i)
+
+        if uncached:
+            fresh = self._encode_uncached([texts[i] for i in uncached], batch_size)
+            for j, i in enumerate(uncached):
+                embeddings[i] = fresh[j]
+                self._cache_store(keys[i], np.asarray(fresh[j], dtype=np.float32))
+
+        return embeddings
+
+    def _encode_uncached(self, texts: list, batch_size: int) -> np.ndarray:
+        """实际调用模型编码缓存未命中的文本"""
+        if self.model_type == "sentence-bert":
+            return self.model.encode(
+                texts,
+                batch_size=batch_size,
+                convert_to_numpy=True,
+                show_progress_bar=False
+            )
+
+        # 智能组批：按长度排序后相邻文本组成一批，padding只补到批内最长，
+        # 结束后按原顺序散射回输出矩阵
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        embeddings = np.empty((len(texts), self.vector_size), dtype=np.float32)
+        for start in range(0, len(order), batch_size):
+            batch_indices = order[start:start + batch_size]
+            batch = [texts[i] for i in batch_indices]
+            inputs = self.tokenizer(
+                batch,
+                padding=True,
+                truncation=True,
+                max_length=512,
+                return_tensors="pt"
+            ).to(self.device)
+
+            outputs = self._forward(inputs)
+
+            # 掩码加权池化一个表达式完成（fp32保精度），整批一次D2H拷贝
+            attention_mask = inputs['attention_mask']
+            pooled = (outputs.last_hidden_state.float() * attention_mask.unsqueeze(-1)).sum(1) \
+                / attention_mask.sum(1, keepdim=True).clamp(min=1e-9)
+            embeddings[batch_indices] = pooled.cpu().numpy()
+
+        return embeddings
+
+    def vectorize_texts(self, texts: list) -> np.ndarray:
+        """
+        跨题目批量向量化：统一提取核心内容并分段，所有分段合并组批编码，
+        再按归属切片平均回每个文本的向量。
+        :param texts: 输入文本列表
+        :return: (len(texts), vector_size) 的向量矩阵，空文本行为零向量
+        """
+        all_segments = []
+        ownership = []  # 每个文本在 all_segments 中的 (起始位置, 分段数)
+        for text in texts:
+            segments = self.segment_text(extract_core_content(text)) if text.strip() else []
+            ownership.append((len(all_segments), len(segments)))
+            all_segments.extend(segments)
+
+        embeddings = self.encode_batch(all_segments)
+
+        result = np.zeros((len(texts), self.vector_size), dtype=np.float32)
+        for i, (start, count) in enumerate(ownership):
+            if count:
+                result[i] = embeddings[start:start + count].mean(axis=0)
+        return result
+
     def segment_text(self, text: str, max_length=500) -> list:
-        """长文本分段策略"""
+        """长文本分段策略：正则一次切出句子单元后贪心打包成段"""
         paragraphs = [p.strip() for p in text.split('\n') if p.strip()]
         segmented = []
+        min_length = max_length * 0.3
         for para in paragraphs:
             if len(para) <= max_length:
                 segmented.append(para)
                 continue
+            # C级正则切句替代逐字符拼接扫描
             punctuation_segments = []
-            current_segment = ""
-            for char in para:
-                current_segment += char
-                if char in {'。', '？', '！', '；'} and len(current_segment) >= max_length * 0.3:
-                    punctuation_segments.append(current_segment.strip())
-                    current_segment = ""
-            if current_segment:
-                punctuation_segments.append(current_segment.strip())
+            buf = ""
+            for sent in _SENT_SPLIT_RE.split(para):
+                if buf and len(buf) + len(sent) > max_length and len(buf) >= min_length:
+                    punctuation_segments.append(buf.strip())
+                    buf = sent
+                else:
+                    buf += sent
+            if buf.strip():
+                punctuation_segments.append(buf.strip())
             for seg in punctuation_segments:
                 if len(seg) <= max_length:
                     segmented.append(seg)